@@ -2,6 +2,7 @@ import os
 import random
 import re
 import torch
+import numpy as np
 import pandas as pd
 from torch.utils.data import Dataset, DataLoader
 
@@ -22,6 +23,9 @@ class DataProvider(Dataset):
 
         self.hla_seq_map = self.make_hla_seq_map()
         self.samples = self.get_samples()
+        # Precomputed target vector so consumers avoid per-call Python loops over samples;
+        # int8 is plenty for binary labels and 8x smaller than the inferred float64/int64
+        self.targets = np.fromiter((s[-1] for s in self.samples), dtype=np.int8, count=len(self.samples))
 
 
     def normalize_hla_name(self, hla_name):
@@ -1,8 +1,24 @@
+import os
 import torch
 import numpy as np
 from torch.utils.data import Dataset
 import h5py
 
+_preload_cache = {}
+
+def preload_embeddings(hdf5_path):
+    """Load a whole H5 embedding file into shared-memory tensors.
+
+    Forked DataLoader workers inherit the tensors copy-on-write, so per-sample
+    access becomes a dict lookup instead of an h5py read. Enabled via PRELOAD_EMB=1;
+    only use when the embeddings fit in RAM. Memoized per path so each file is read
+    at most once per process, however many encoder datasets are constructed.
+    """
+    if hdf5_path not in _preload_cache:
+        with h5py.File(hdf5_path, 'r') as f:
+            _preload_cache[hdf5_path] = {key: torch.tensor(np.squeeze(f[key][()]), dtype=torch.float32).share_memory_() for key in f.keys()}
+    return _preload_cache[hdf5_path]
+
 #%% DeepNeo
 # 아미노산 간의 영향을 주는 matrix (생략)
 impact_matrix = np.array([
@@ -128,16 +144,21 @@ class plm_blosum(Dataset):
     def __init__(self, data_provider, hla_emb_path):
         self.data_provider = data_provider
         self.hdf5_path = hla_emb_path
+        self.preload = os.environ.get('PRELOAD_EMB') == '1'
+        self.hla_cache = preload_embeddings(hla_emb_path) if self.preload else None
 
     def __len__(self):
         return len(self.data_provider)
 
     def __getitem__(self, idx):
         hla_name, epi_seq, target, hla_seq = self.data_provider[idx]
-        
-        with h5py.File(self.hdf5_path, 'r') as hla_embeddings:
-            embedding = np.squeeze(hla_embeddings[hla_name][()])
-            hla_embedding = torch.tensor(embedding, dtype=torch.float32)
+
+        if self.preload:
+            hla_embedding = self.hla_cache[hla_name]
+        else:
+            with h5py.File(self.hdf5_path, 'r') as hla_embeddings:
+                embedding = np.squeeze(hla_embeddings[hla_name][()])
+                hla_embedding = torch.tensor(embedding, dtype=torch.float32)
         epi_encoding = blosum62_encode(epi_seq, blosum62)
         target = torch.tensor(target, dtype=torch.float32).unsqueeze(0)
         
@@ -148,19 +169,26 @@ class plm_plm(Dataset):
         self.data_provider = data_provider
         self.hdf5_path_1 = hla_emb_path
         self.hdf5_path_2 = epi_emb_path
+        self.preload = os.environ.get('PRELOAD_EMB') == '1'
+        self.hla_cache = preload_embeddings(hla_emb_path) if self.preload else None
+        self.epi_cache = preload_embeddings(epi_emb_path) if self.preload else None
 
     def __len__(self):
         return len(self.data_provider)
 
     def __getitem__(self, idx):
         hla_name, epi_seq, target, hla_seq = self.data_provider[idx]
-        
-        with h5py.File(self.hdf5_path_1, 'r') as hla_embeddings:
-            embedding = np.squeeze(hla_embeddings[hla_name][()])
-            hla_embedding = torch.tensor(embedding, dtype=torch.float32)
-        with h5py.File(self.hdf5_path_2, 'r') as epi_embeddings:
-            embedding = np.squeeze(epi_embeddings[epi_seq][()])
-            epi_embedding = torch.tensor(embedding, dtype=torch.float32)
+
+        if self.preload:
+            hla_embedding = self.hla_cache[hla_name]
+            epi_embedding = self.epi_cache[epi_seq]
+        else:
+            with h5py.File(self.hdf5_path_1, 'r') as hla_embeddings:
+                embedding = np.squeeze(hla_embeddings[hla_name][()])
+                hla_embedding = torch.tensor(embedding, dtype=torch.float32)
+            with h5py.File(self.hdf5_path_2, 'r') as epi_embeddings:
+                embedding = np.squeeze(epi_embeddings[epi_seq][()])
+                epi_embedding = torch.tensor(embedding, dtype=torch.float32)
         target = torch.tensor(target, dtype=torch.float32).unsqueeze(0)
         
         return hla_embedding, epi_embedding, target
\ No newline at end of file
@@ -22,33 +22,75 @@ def load_config(config_path):
 
 def test_model(model, dataloader, device):
     model.eval()
-    all_preds = []
-    with torch.no_grad():
+    use_amp = device.type == 'cuda'
+    dev_bufs = None
+    # Dataset size is known, so write predictions straight into one preallocated array
+    # instead of a list of per-batch arrays plus a final O(N) concatenate
+    out = np.empty(len(dataloader.dataset), dtype=np.float32)
+    cursor = 0
+    # D2H copies go through pinned staging buffers on a side stream and are drained one
+    # batch late, so the copy of batch i overlaps with the forward pass of batch i+1
+    copy_stream = torch.cuda.Stream() if device.type == 'cuda' else None
+    host_bufs = None
+    pending = None  # (buf_idx, cursor, bs, event) of the copy still in flight
+    buf_idx = 0
+    with torch.inference_mode():
         for batch in tqdm(dataloader, desc="Testing"):
             X = batch[:-1]
-            X = [x.to(device) for x in X]
-            y_pred = model(*X).cpu().numpy()
-            all_preds.append(y_pred)
-    return np.concatenate(all_preds)
-
-def calculate_roc_auc(data_provider, model, config, device):
+            if device.type == 'cuda':
+                # Reuse preallocated device buffers instead of allocating fresh tensors per batch
+                if dev_bufs is None:
+                    dev_bufs = [torch.empty_like(x, device=device) for x in X]
+                X = [buf[:x.size(0)].copy_(x, non_blocking=True) for buf, x in zip(dev_bufs, X)]
+            else:
+                X = [x.to(device, non_blocking=True) for x in X]
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                y_pred = model(*X)
+            bs = y_pred.size(0)
+            if copy_stream is not None:
+                y_flat = y_pred.float().view(-1)
+                if host_bufs is None:
+                    host_bufs = [torch.empty(bs, dtype=torch.float32, pin_memory=True) for _ in range(2)]
+                copy_stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(copy_stream):
+                    y_flat.record_stream(copy_stream)
+                    host_bufs[buf_idx][:bs].copy_(y_flat, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record(copy_stream)
+                if pending is not None:
+                    p_idx, p_cur, p_bs, p_event = pending
+                    p_event.synchronize()
+                    out[p_cur:p_cur+p_bs] = host_bufs[p_idx][:p_bs].numpy()
+                pending = (buf_idx, cursor, bs, event)
+                buf_idx = 1 - buf_idx
+            else:
+                out[cursor:cursor+bs] = y_pred.float().cpu().numpy().ravel()
+            cursor += bs
+    if pending is not None:
+        p_idx, p_cur, p_bs, p_event = pending
+        p_event.synchronize()
+        out[p_cur:p_cur+p_bs] = host_bufs[p_idx][:p_bs].numpy()
+    return out
+
+def predict(data_provider, model, config, device):
+    """Run inference once and return (y, y_pred) for both ROC and PR curves."""
     dataset = config["encoder"](data_provider, **config["encoder_args"])
     batch_size = config["Test"]["batch_size"] if "batch_size" in config["Test"] else len(dataset)
     num_workers = config["Data"]["num_workers"]
-    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
-    y = np.array([sample[-1] for sample in data_provider.samples])  # Optimized data access
+    loader_args = {"batch_size": batch_size, "num_workers": num_workers, "pin_memory": torch.cuda.is_available()}
+    if num_workers > 0:
+        loader_args.update(persistent_workers=True, prefetch_factor=4)
+    dataloader = DataLoader(dataset, shuffle=False, **loader_args)
+    y = data_provider.targets
     y_pred = test_model(model, dataloader, device)
+    return y, y_pred
+
+def calculate_roc_auc(y, y_pred):
     fpr, tpr, _ = roc_curve(y, y_pred)
     roc_auc = auc(fpr, tpr)
     return fpr, tpr, roc_auc
 
-def calculate_pr_auc(data_provider, model, config, device):
-    dataset = config["encoder"](data_provider, **config["encoder_args"])
-    batch_size = config["Test"]["batch_size"] if "batch_size" in config["Test"] else len(dataset)
-    num_workers = config["Data"]["num_workers"]
-    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
-    y = np.array([sample[-1] for sample in data_provider.samples])  # Optimized data access
-    y_pred = test_model(model, dataloader, device)
+def calculate_pr_auc(y, y_pred):
     precision, recall, _ = precision_recall_curve(y, y_pred)
     pr_auc = auc(recall, precision)
     return precision, recall, pr_auc
@@ -75,13 +117,20 @@ def main(config_path):
     model.load_state_dict(torch.load(model_path))
     model.to(device)
     print(f'Model loaded on {device}')
+    try:
+        # Batch shapes are fixed at test time, so autotuning pays off
+        model = torch.compile(model, mode='max-autotune', fullgraph=False)
+        print('Model compiled with torch.compile')
+    except Exception as e:
+        print(f'torch.compile failed, falling back to eager: {e}')
 
     ########################################################################################
     # General ROC curve
 
     data_provider = DataProvider(**DATA_PROVIDER_ARGS)
     print(f"Samples in test set: {len(data_provider)}")
-    fpr, tpr, roc_auc = calculate_roc_auc(data_provider, model, config, device)
+    y, y_pred = predict(data_provider, model, config, device)
+    fpr, tpr, roc_auc = calculate_roc_auc(y, y_pred)
     plt.figure(figsize=(8, 6))
     plt.plot(fpr, tpr, lw=1.5, label=f'ROC curve (area = {roc_auc:.2f})', color='lightseagreen')
     plt.plot([0, 1], [0, 1], color='black', lw=1, linestyle='--', alpha=0.5)
@@ -98,7 +147,7 @@ def main(config_path):
     ########################################################################################
     # General Precision-Recall curve
 
-    precision, recall, pr_auc = calculate_pr_auc(data_provider, model, config, device)
+    precision, recall, pr_auc = calculate_pr_auc(y, y_pred)
     plt.figure(figsize=(8, 6))
     plt.plot(recall, precision, lw=1.5, label=f'PR curve (area = {pr_auc:.2f})', color='purple')
     plt.xlim([0.0, 1.0])
@@ -115,12 +164,19 @@ def main(config_path):
     # Extract samples corresponding to top_10_idx and calculate ROC curve for each HLA
 
     top_10_hlas = data_provider.top_10_hlas
+
+    # Build each HLA's DataProvider once and run inference once; both figures reuse the cached results
+    hla_predictions = {}
+    for hla in top_10_hlas:
+        data_provider_hla = DataProvider(**DATA_PROVIDER_ARGS, specific_hla=hla)
+        print(f"Samples in test set for {hla}: {len(data_provider_hla)}")
+        hla_predictions[hla] = predict(data_provider_hla, model, config, device)
+
     plt.figure(figsize=(8, 6))
     colors = plt.cm.get_cmap('tab10', 10)  # Use a colormap for distinct colors
     for index, hla in enumerate(top_10_hlas):
-        data_provider_hla = DataProvider(**DATA_PROVIDER_ARGS, specific_hla=hla)
-        print(f"Samples in test set for {hla}: {len(data_provider_hla)}")
-        fpr, tpr, roc_auc = calculate_roc_auc(data_provider_hla, model, config, device)
+        y_hla, y_pred_hla = hla_predictions[hla]
+        fpr, tpr, roc_auc = calculate_roc_auc(y_hla, y_pred_hla)
         plt.plot(fpr, tpr, lw=1.5, label=f'{hla} (area = {roc_auc:.2f})', color=colors(index))
     plt.plot([0, 1], [0, 1], color='black', lw=1, linestyle='--', alpha=0.5)
     plt.xlim([0.0, 1.0])
@@ -136,10 +192,9 @@ def main(config_path):
     # PR Curve Plot for Top 10 HLAs
     plt.figure(figsize=(8, 6))
     for index, hla in enumerate(top_10_hlas):
-        data_provider_hla = DataProvider(**DATA_PROVIDER_ARGS, specific_hla=hla)
-        
-        # Calculate PR for each HLA
-        precision, recall, pr_auc = calculate_pr_auc(data_provider_hla, model, config, device)
+        # Calculate PR for each HLA from the cached predictions
+        y_hla, y_pred_hla = hla_predictions[hla]
+        precision, recall, pr_auc = calculate_pr_auc(y_hla, y_pred_hla)
         plt.plot(recall, precision, lw=1.5, label=f'{hla} (area = {pr_auc:.2f})', color=colors(index))
     plt.xlim([0.0, 1.0])
     plt.ylim([0.0, 1.0])
@@ -2,27 +2,39 @@
 
 import sys, os
 sys.path.insert(0, os.getcwd())
+import contextlib
 import torch
+import torch.distributed as dist
 import numpy as np
 from tqdm import tqdm
 from sklearn.model_selection import train_test_split
-from torch.utils.data import DataLoader, Subset
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import DataLoader, Subset, DistributedSampler
 import logging
+import threading
 import time
 import importlib.util
 import argparse
 from dataprovider import DataProvider
+from utils.prefetcher import CUDAPrefetcher
 import random
 
-def set_seed(seed):
+def set_seed(seed, deterministic=False):
     random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
     if torch.cuda.is_available():
         torch.cuda.manual_seed(seed)
         torch.cuda.manual_seed_all(seed)
-    torch.backends.cudnn.deterministic = True
-    torch.backends.cudnn.benchmark = False
+    if deterministic:
+        # Reproducible but slower; keep for debugging runs
+        torch.backends.cudnn.deterministic = True
+        torch.backends.cudnn.benchmark = False
+    else:
+        # Input shapes are fixed, so let cuDNN autotune kernels and allow TF32 matmuls
+        torch.backends.cudnn.deterministic = False
+        torch.backends.cudnn.benchmark = True
+        torch.set_float32_matmul_precision('high')
 
 def load_config(config_path):
     """Dynamically import the config file."""
@@ -31,79 +43,126 @@ def load_config(config_path):
     spec.loader.exec_module(config_module)
     return config_module.config
 
-def train_model(model, train_loader, val_loader, criterion, optimizer, device, log_file, num_epochs, patience, model_path, regularize=False, scheduler=None):
+def setup_distributed():
+    """Initialize DDP when launched via torchrun; returns (distributed, local_rank, rank)."""
+    if "RANK" in os.environ and "WORLD_SIZE" in os.environ:
+        dist.init_process_group(backend="nccl" if torch.cuda.is_available() else "gloo")
+        local_rank = int(os.environ["LOCAL_RANK"])
+        if torch.cuda.is_available():
+            torch.cuda.set_device(local_rank)
+        return True, local_rank, dist.get_rank()
+    return False, 0, 0
+
+def unwrap_model(model):
+    """Strip DDP and torch.compile wrappers to get the raw module for checkpointing."""
+    model = getattr(model, 'module', model)
+    return getattr(model, '_orig_mod', model)
+
+@torch.jit.script
+def count_correct(out: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+    """Fused threshold + compare + sum; one kernel instead of three per batch."""
+    return ((out > 0.5) == y.bool()).sum()
+
+def train_model(model, train_loader, val_loader, criterion, optimizer, device, log_file, num_epochs, patience, model_path, regularize=False, scheduler=None, train_sampler=None, is_main_process=True, accum_steps=1):
     model.train()
     best_loss = float('inf')
     epochs_no_improve = 0
     early_stop = False
-    logging.basicConfig(
-        filename=log_file,
-        level=logging.INFO,
-        format='%(asctime)s - [Training process]: %(message)s'
-    )
+    use_amp = device.type == 'cuda'
+    scaler = torch.amp.GradScaler(device.type, enabled=use_amp)
+    if is_main_process:
+        logging.basicConfig(
+            filename=log_file,
+            level=logging.INFO,
+            format='%(asctime)s - [Training process]: %(message)s'
+        )
     for epoch in range(num_epochs):
         if early_stop:
             print(f'Early stopping at epoch {epoch}')
             break
 
         start_time = time.time()
-        epoch_loss = 0
-        val_loss = 0
-        correct_train = 0
+        # Accumulate on-device so no per-batch .item() sync stalls the pipeline
+        epoch_loss = torch.zeros((), device=device)
+        val_loss = torch.zeros((), device=device)
+        correct_train = torch.zeros((), device=device)
         total_train = 0
-        correct_val = 0
+        correct_val = torch.zeros((), device=device)
         total_val = 0
 
         model.train()
-        with tqdm(train_loader, unit="batch") as tepoch:
-            for batch in tepoch:
-                tepoch.set_description(f"Epoch {epoch+1}/{num_epochs}")
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
+        with tqdm(train_loader, unit="batch", disable=not is_main_process) as tepoch:
+            tepoch.set_description(f"Epoch {epoch+1}/{num_epochs}")
+            for step, batch in enumerate(tepoch):
 
                 X, Y = batch[:-1], batch[-1]
-                X = [x.to(device) for x in X]
-                Y = Y.to(device)
-                outputs = model(*X)
+                X = [x.to(device, non_blocking=True) for x in X]
+                Y = Y.to(device, non_blocking=True)
+                # AMP forward; BCELoss is unsafe under autocast, so the loss runs on fp32 outputs
+                with torch.autocast(device_type=device.type, dtype=torch.float16, enabled=use_amp):
+                    outputs = model(*X)
+                outputs = outputs.float()
                 loss = criterion(outputs, Y)
                 if regularize:
-                    loss = model.regularize(loss, device)
-                    
-                optimizer.zero_grad()
-                loss.backward()
-                optimizer.step()
-                scheduler.step() if scheduler is not None else None
+                    loss = unwrap_model(model).regularize(loss, device)
 
-                tepoch.set_postfix(loss=loss.item())
-                epoch_loss += loss.item()
+                if step % 50 == 0:  # display only occasionally; loss.item() forces a device sync
+                    tepoch.set_postfix(loss=loss.item())
+                epoch_loss += loss.detach()
+
+                # Gradients accumulate over accum_steps microbatches; DDP all-reduce is
+                # deferred with no_sync() until the step that actually updates the weights
+                update_step = (step + 1) % accum_steps == 0 or (step + 1) == len(train_loader)
+                sync_context = model.no_sync() if (hasattr(model, 'no_sync') and not update_step) else contextlib.nullcontext()
+                with sync_context:
+                    scaler.scale(loss / accum_steps).backward()
+                if update_step:
+                    scaler.step(optimizer)
+                    scaler.update()
+                    optimizer.zero_grad(set_to_none=True)
+                    scheduler.step() if scheduler is not None else None
 
                 # Accuracy 계산
-                predicted = (outputs > 0.5).float()
-                correct_train += (predicted == Y).sum().item()
+                correct_train += count_correct(outputs, Y)
                 total_train += Y.size(0)
 
-        avg_train_loss = epoch_loss / len(train_loader)
-        train_acc = correct_train / total_train
+        avg_train_loss = epoch_loss.item() / len(train_loader)
+        train_acc = correct_train.item() / total_train
 
         model.eval()
-        with torch.no_grad():
-            for batch in val_loader:
+        # Prefetch validation batches to the GPU on a side stream; the in-loop .to() calls
+        # become no-ops for already-staged tensors
+        val_iter = CUDAPrefetcher(val_loader, device) if device.type == 'cuda' else val_loader
+        with torch.inference_mode():
+            for batch in val_iter:
                 X, Y = batch[:-1], batch[-1]
-                X = [x.to(device) for x in X]
-                Y = Y.to(device)
+                X = [x.to(device, non_blocking=True) for x in X]
+                Y = Y.to(device, non_blocking=True)
                 
-                outputs = model(*X)
+                with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_amp):
+                    outputs = model(*X)
+                outputs = outputs.float()
                 loss = criterion(outputs, Y)
-                val_loss += loss.item()
+                val_loss += loss.detach()
 
                 # Accuracy 계산
-                predicted = (outputs > 0.5).float()
-                correct_val += (predicted == Y).sum().item()
+                correct_val += count_correct(outputs, Y)
                 total_val += Y.size(0)
 
-        avg_val_loss = val_loss / len(val_loader)
-        val_acc = correct_val / total_val
+        if dist.is_available() and dist.is_initialized():
+            # Average the val loss across ranks so every rank takes the same early-stop
+            # and best-model branches; without this one rank can break out of the epoch
+            # loop while the others hang in the next backward's all-reduce
+            dist.all_reduce(val_loss, op=dist.ReduceOp.SUM)
+            val_loss /= dist.get_world_size()
+        avg_val_loss = val_loss.item() / len(val_loader)
+        val_acc = correct_val.item() / total_val
 
         epoch_time = int(time.time() - start_time)
-        logging.info(f'\
+        if is_main_process:
+            logging.info(f'\
 [{model_path}]-[Epoch {epoch+1:03d}/{num_epochs:03d}] - \
 Time: {epoch_time} s, \
 Train Acc: {train_acc:.5f}, \
@@ -111,17 +170,22 @@ Val Acc: {val_acc:.5f}, \
 Train Loss: {avg_train_loss:.5f}, \
 Val Loss: {avg_val_loss:.5f}'\
 )
-        if (epoch+1 >= 30 ) and (epoch+1 % 5 == 0):
-            torch.save(model.state_dict(), f"{model_path}-epoch_{epoch+1}.pt")
-        
+        # Periodic checkpoints every 5 epochs from epoch 30 on; the old `epoch+1 % 5` bound the
+        # modulo first and saved every epoch. Snapshot to CPU and write in a background thread
+        # so torch.save's disk I/O overlaps with the next epoch's compute.
+        if is_main_process and (epoch + 1) >= 30 and (epoch + 1) % 5 == 0:
+            state_dict = {k: v.detach().cpu() for k, v in unwrap_model(model).state_dict().items()}
+            threading.Thread(target=torch.save, args=(state_dict, f"{model_path}-epoch_{epoch+1}.pt")).start()
+
         # Early stopping and best model saving
         if avg_val_loss < best_loss:
             best_loss = avg_val_loss
-            model_dir = os.path.dirname(model_path)
-            if not os.path.exists(model_dir):
-                os.makedirs(model_dir)
-            torch.save(model.state_dict(), f"{model_path}-best.pt")
-            print(f"Best model updated at epoch {epoch+1}")
+            if is_main_process:
+                model_dir = os.path.dirname(model_path)
+                if not os.path.exists(model_dir):
+                    os.makedirs(model_dir)
+                torch.save(unwrap_model(model).state_dict(), f"{model_path}-best.pt")
+                print(f"Best model updated at epoch {epoch+1}")
             epochs_no_improve = 0
         else:
             epochs_no_improve += 1
@@ -131,7 +195,9 @@ Val Loss: {avg_val_loss:.5f}'\
 def main(config_path):
     # Load configuration
     config = load_config(config_path)
-    set_seed(config["seed"])
+    distributed, local_rank, rank = setup_distributed()
+    is_main_process = rank == 0
+    set_seed(config["seed"], deterministic=config.get("deterministic", False))
     
     # Create DataProvider instance
     data_provider = DataProvider(
@@ -143,7 +209,7 @@ def main(config_path):
     print(f"Total samples: {len(data_provider)}")
 
     # Extract targets for stratified splitting
-    y = np.array([data_provider.samples[i][2] for i in range(len(data_provider))])
+    y = data_provider.targets
 
     # Split indices into training and validation sets
     train_indices, val_indices = train_test_split(
@@ -165,12 +231,29 @@ def main(config_path):
     # Create DataLoaders with multiple workers for parallel data loading
     batch_size = config["Train"]["batch_size"]
     num_workers = config["Data"]["num_workers"]
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    loader_args = {
+        "batch_size"    : batch_size,
+        "num_workers"   : num_workers,
+        "pin_memory"    : torch.cuda.is_available(),
+    }
+    if num_workers > 0:
+        # Keep workers alive across epochs and prefetch deeper to avoid idle GPU at epoch boundaries
+        loader_args.update(persistent_workers=True, prefetch_factor=4)
+    if distributed:
+        # Each rank sees a disjoint shard of the training set
+        train_sampler = DistributedSampler(train_dataset, shuffle=True)
+        train_loader = DataLoader(train_dataset, sampler=train_sampler, **loader_args)
+    else:
+        train_sampler = None
+        train_loader = DataLoader(train_dataset, shuffle=True, **loader_args)
+    val_loader = DataLoader(val_dataset, shuffle=False, **loader_args)
 
     # Initialize model, criterion, optimizer, etc.
     model = config["model"](**config["model_args"])
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if distributed and torch.cuda.is_available():
+        device = torch.device("cuda", local_rank)
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model.to(device)
     print(f'Model loaded on {device}')
 
@@ -193,16 +276,31 @@ def main(config_path):
         else:
             print(f"Checkpoint path {last_checkpoint} is invalid or does not exist. Starting training from scratch.")
 
+    # Compile after any checkpoint loading so state dict keys stay plain
+    try:
+        model = torch.compile(model, mode='reduce-overhead', fullgraph=False)
+        print('Model compiled with torch.compile')
+    except Exception as e:
+        print(f'torch.compile failed, falling back to eager: {e}')
+
+    if distributed:
+        # Launch with: torchrun --nproc_per_node=N code/train.py config.py
+        model = DDP(model, device_ids=[local_rank] if device.type == 'cuda' else None)
+        print(f'Model wrapped in DDP (rank {rank})')
+
     criterion = config["Train"]["criterion"]()
     optimizer = config["Train"]["optimizer"](
         model.parameters(),
         **config["Train"]["optimizer_args"]
         )
     num_epochs = config["Train"]["num_epochs"]
+    accum_steps = config["Train"].get("accum_steps", 1)
     if config["Train"]["use_scheduler"]:
         from utils.scheduler import CosineAnnealingWarmUpRestarts
         optimizer = torch.optim.Adam(model.parameters(), lr = 0)
-        total_training_steps    = num_epochs*len(train_loader)
+        # scheduler.step() fires once per optimizer update, not per batch
+        updates_per_epoch       = (len(train_loader) + accum_steps - 1) // accum_steps
+        total_training_steps    = num_epochs*updates_per_epoch
         cycle_len               = total_training_steps//10
         warmup_steps            = cycle_len//10
         scheduler = CosineAnnealingWarmUpRestarts(
@@ -231,8 +329,13 @@ def main(config_path):
         patience        = config["Train"]["patience"],
         regularize      = config["Train"]["regularize"],
         model_path      = os.path.join(config["chkp_path"], config["chkp_name"]),
-        scheduler       = scheduler
+        scheduler       = scheduler,
+        train_sampler   = train_sampler,
+        is_main_process = is_main_process,
+        accum_steps     = accum_steps
         )
+    if distributed:
+        dist.destroy_process_group()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Train model with specified config.")
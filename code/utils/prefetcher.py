@@ -0,0 +1,43 @@
+import torch
+
+class CUDAPrefetcher:
+    """Stages the next batch on the GPU over a side stream while the current one is processed.
+
+    Wraps a DataLoader and issues the H2D copies for batch i+1 on its own CUDA stream
+    so they overlap with the compute on batch i. The loader should use pin_memory=True,
+    otherwise the copies fall back to synchronous pageable transfers.
+    """
+    def __init__(self, loader, device):
+        self.loader = iter(loader)
+        self.device = device
+        self.stream = torch.cuda.Stream()
+        self.host_batch = None  # keep the pinned source alive until the copy lands
+        self.next_batch = None
+        self.preload()
+
+    def preload(self):
+        try:
+            batch = next(self.loader)
+        except StopIteration:
+            self.host_batch = None
+            self.next_batch = None
+            return
+        self.host_batch = batch
+        with torch.cuda.stream(self.stream):
+            self.next_batch = [x.to(self.device, non_blocking=True) for x in batch]
+
+    def next(self):
+        if self.next_batch is None:
+            return None
+        torch.cuda.current_stream().wait_stream(self.stream)
+        batch = self.next_batch
+        for x in batch:
+            x.record_stream(torch.cuda.current_stream())
+        self.preload()
+        return batch
+
+    def __iter__(self):
+        batch = self.next()
+        while batch is not None:
+            yield batch
+            batch = self.next()
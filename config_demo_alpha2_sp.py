@@ -9,6 +9,7 @@ config = {
     "log_file"          : "train.log",
     "plot_path"         : "plots",
     "seed"              : 100,
+    "deterministic"     : False,
 
     "model"             : model.cat2_alpha_sp,
     "model_args"        : {
@@ -59,6 +60,7 @@ config = {
 
     "Train": {
         "batch_size"    : 128,
+        "accum_steps"   : 1,
         "num_epochs"    : 50,
         "patience"      : 100,
         "regularize"    : False,            # true if regularize method is implemented in the model
@@ -71,7 +73,7 @@ config = {
     },
     
     "Test": {
-        "batch_size"    : 64,
+        "batch_size"    : 512,
         "chkp_prefix"   : "best",
     },
 }
\ No newline at end of file
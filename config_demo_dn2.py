@@ -9,6 +9,7 @@ config = {
     "log_file"          : "train.log",
     "plot_path"         : "plots",
     "seed"              : 100,
+    "deterministic"     : False,
     
     "model"             : model.DeepNeo_2_Custom,
     "model_args"        : {
@@ -46,6 +47,7 @@ config = {
 
     "Train": {
         "batch_size"    : 128,
+        "accum_steps"   : 1,
         "num_epochs"    : 100,
         "patience"      : 10,
         "regularize"    : True,            # true if regularize method is implemented in the model